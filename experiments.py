@@ -1,10 +1,13 @@
 import math
 import csv
+import multiprocessing
 import random
+from collections import deque
 from pathlib import Path
-from typing import Callable
+from typing import Callable, List
 
 import networkit as nk
+import numpy as np
 from graph_generators import generate_chung_lu_pl, generate_girg
 
 from simulations import ActivationType, run_perturbed_percolation, run_bootstrap_percolation
@@ -28,8 +31,126 @@ def reduce_graph_size(g: nk.Graph, n: int):
     return g
 
 
-def run_perturbed_on_real_world_experiment():
-    """Runs perturbed percolation on two real-world graphs."""
+def _produce(function: Callable, args: tuple, slots, ready):
+    """Worker process of _prefetch, which puts the items of function(*args) into the ready queue"""
+    # A new process does not inherit the networkit configuration of runner.py
+    nk.engineering.setNumberOfThreads(1)
+    iterator = function(*args)
+    while True:
+        slots.acquire()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            ready.put((True, None))
+            return
+        except BaseException as e:
+            ready.put((True, e))
+            return
+        ready.put((False, item))
+        del item
+
+
+def _prefetch(function: Callable, *args, depth: int = 2):
+    """Iterates over the items of the generator function(*args), which a worker process computes in advance.
+    At most depth items, including the one currently in use, are resident at once. The items are pickled,
+    so function, its arguments and its items need to be picklable."""
+    assert depth >= 2
+    # Forking a process that already uses OpenMP through networkit is unsafe
+    context = multiprocessing.get_context('spawn')
+    slots = context.Semaphore(depth - 1)
+    ready = context.Queue()
+    process = context.Process(target=_produce, args=(function, args, slots, ready), daemon=True)
+    process.start()
+
+    try:
+        while True:
+            finished, item = ready.get()
+            slots.release()
+            if finished:
+                process.join()
+                if item is not None:
+                    raise item
+                return
+            yield item
+    finally:
+        if process.is_alive():
+            process.terminate()
+
+
+def _load_real_world_pairs(local_names: List[str], global_names: List[str]):
+    """Reads all combinations of real-world local and global graphs, with the local graph reduced
+    to the size of the global graph. Stops at the first global graph larger than the local graph."""
+    for local_name in local_names:
+        local_source = str(Path(f"inputs/{local_name}.txt"))
+
+        print(f"Reading local graph {local_name}...")
+        g_local = nk.graphio.EdgeListReader(' ', 1).read(local_source)
+        g_local = nk.components.ConnectedComponents.extractLargestConnectedComponent(
+            g_local, compactGraph=True)
+        n_local = g_local.numberOfNodes()
+
+        for global_name in global_names:
+            global_source = str(Path(f"inputs/{global_name}.txt"))
+
+            print(f"Reading global graph {global_name}...")
+            g_global: nk.Graph = nk.graphio.EdgeListReader(
+                ' ', 1).read(global_source)
+            n = g_global.numberOfNodes()
+            if n_local < n:
+                print(
+                    f"Skipping {local_name}({n_local=}) + {global_name}({n=})")
+                return
+            g_local_new = reduce_graph_size(g_local, n)
+
+            yield local_name, global_name, g_local_new, g_global
+
+
+def _pack_graph(g: nk.Graph):
+    """Returns the edges of g in an order in which adding them reproduces the neighbor order of every
+    node, which the activation types of run_perturbed_percolation depend on. Unlike pickling, this keeps
+    the graph identical when sending it to another process. Such an order exists for graphs that were
+    only built by adding edges."""
+    n = g.upperNodeIdBound()
+    adjacency = [list(g.iterNeighbors(u)) for u in range(n)]
+    positions = [0] * n
+    us, vs = [], []
+    # An edge can be added as soon as it is the next neighbor of both of its nodes
+    nodes = deque(range(n))
+    while nodes:
+        u = nodes.popleft()
+        if positions[u] == len(adjacency[u]):
+            continue
+        v = adjacency[u][positions[u]]
+        if u == v:
+            positions[u] += 1
+        elif positions[v] < len(adjacency[v]) and adjacency[v][positions[v]] == u:
+            positions[u] += 1
+            positions[v] += 1
+            nodes.append(v)
+        else:
+            continue
+        us.append(u)
+        vs.append(v)
+        nodes.append(u)
+    assert len(us) == g.numberOfEdges()
+    return n, np.array(us, dtype=np.uint64), np.array(vs, dtype=np.uint64)
+
+
+def _unpack_graph(packed_graph):
+    """Rebuilds a graph packed by _pack_graph"""
+    n, us, vs = packed_graph
+    return nk.GraphFromCoo((us, vs), n=n)
+
+
+def _load_packed_real_world_pairs(local_names: List[str], global_names: List[str]):
+    """Like _load_real_world_pairs, but with packed graphs"""
+    for local_name, global_name, g_local_new, g_global in _load_real_world_pairs(local_names, global_names):
+        yield local_name, global_name, _pack_graph(g_local_new), _pack_graph(g_global)
+
+
+def run_perturbed_on_real_world_experiment(pipelined: bool = False):
+    """Runs perturbed percolation on two real-world graphs. If pipelined, the next pair of graphs is
+    loaded in a worker process while the current pair percolates."""
     local_names = ["inf-roadNet-PA", "inf-roadNet-CA", "inf-italy-osm"]
     global_names = ["soc-google-plus",
                     "soc-twitter-follows", "soc-delicious", "soc-youtube"]
@@ -41,46 +162,34 @@ def run_perturbed_on_real_world_experiment():
         writer.writeheader()
 
         print("Running perturbed percolation experiments...")
-        for local_name in local_names:
-            local_source = str(Path(f"inputs/{local_name}.txt"))
-
-            print(f"Reading local graph {local_name}...")
-            g_local = nk.graphio.EdgeListReader(' ', 1).read(local_source)
-            g_local = nk.components.ConnectedComponents.extractLargestConnectedComponent(
-                g_local, compactGraph=True)
-            n_local = g_local.numberOfNodes()
-
-            for global_name in global_names:
-                global_source = str(Path(f"inputs/{global_name}.txt"))
-
-                print(f"Reading global graph {global_name}...")
-                g_global: nk.Graph = nk.graphio.EdgeListReader(
-                    ' ', 1).read(global_source)
-                n = g_global.numberOfNodes()
-                if n_local < n:
-                    print(
-                        f"Skipping {local_name}({n_local=}) + {global_name}({n=})")
-                    return
-                g_local_new = reduce_graph_size(g_local, n)
-
-                # r = int(math.log(n))
-                r = int(average_degree(g_global))
-                initially_active = random.randrange(n)
-                print("Running perturbed percolation...")
-                new_activations, total_activations = run_perturbed_percolation(
-                    g_local_new, g_global, r, initially_active)
-                for cur_round, data in enumerate(new_activations):
-                    writer.writerow({
-                        'local_graph': local_name,
-                        'global_graph': global_name,
-                        'r': r,
-                        'round': cur_round,
-                        'active': total_activations[cur_round],
-                        'new': sum(data.values()),
-                        'new_local': data[ActivationType.LOCAL],
-                        'new_global': data[ActivationType.GLOBAL],
-                        'new_both': data[ActivationType.BOTH],
-                    })
+        if pipelined:
+            pairs = ((local_name, global_name, _unpack_graph(g_local_new), _unpack_graph(g_global))
+                     for local_name, global_name, g_local_new, g_global
+                     in _prefetch(_load_packed_real_world_pairs, local_names, global_names))
+        else:
+            pairs = _load_real_world_pairs(local_names, global_names)
+        for local_name, global_name, g_local_new, g_global in pairs:
+            n = g_global.numberOfNodes()
+
+            # r = int(math.log(n))
+            r = int(average_degree(g_global))
+            # Drawn here rather than while loading, to keep the random sequence of the serial run
+            initially_active = random.randrange(n)
+            print("Running perturbed percolation...")
+            new_activations, total_activations = run_perturbed_percolation(
+                g_local_new, g_global, r, initially_active)
+            for cur_round, data in enumerate(new_activations):
+                writer.writerow({
+                    'local_graph': local_name,
+                    'global_graph': global_name,
+                    'r': r,
+                    'round': cur_round,
+                    'active': total_activations[cur_round],
+                    'new': sum(data.values()),
+                    'new_local': data[ActivationType.LOCAL],
+                    'new_global': data[ActivationType.GLOBAL],
+                    'new_both': data[ActivationType.BOTH],
+                })
 
 
 def run_perturbed_on_real_world_different_r_experiment():
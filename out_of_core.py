@@ -0,0 +1,314 @@
+import io
+import itertools
+import tempfile
+import warnings
+from pathlib import Path
+
+import numpy as np
+
+from simulations import ActivationType
+
+# Default amount of memory used for the neighbors gathered at once
+DEFAULT_MEMORY_BUDGET = 2 ** 30
+# Rough number of bytes needed per gathered neighbor (indices, sources, positions, sorting, grouping)
+BYTES_PER_NEIGHBOR = 64
+# Rough number of bytes needed per byte of a parsed edge list chunk. A line of at least 4 bytes holds
+# one edge, which is parsed, stored in both directions and sorted.
+BYTES_PER_INPUT_BYTE = 4 * BYTES_PER_NEIGHBOR
+
+# Node states stored in the on-disk status array. Nodes activated in the current round keep their
+# activation type until the round is finished, since a later local neighbor turns GLOBAL into BOTH.
+INACTIVE = 0
+NEW_LOCAL = 1
+NEW_GLOBAL = 2
+NEW_BOTH = 3
+ACTIVE = 4
+
+
+def _open_array(path: Path, dtype, n: int):
+    """Creates a zero-initialized memory-mapped array of size n"""
+    return np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(n,))
+
+
+def _node_dtype(n: int):
+    """Returns the smallest integer type used for storing the ids of n nodes"""
+    return np.int32 if n <= np.iinfo(np.int32).max else np.int64
+
+
+def load_csr(path: str):
+    """Opens a CSR graph written by edge_list_to_csr or graph_to_csr as memory-mapped arrays"""
+    indptr = np.load(Path(path) / "indptr.npy", mmap_mode='r')
+    indices = np.load(Path(path) / "indices.npy", mmap_mode='r')
+    return indptr, indices
+
+
+def graph_to_csr(g, target: str):
+    """Writes a networkit graph with compact node ids as CSR files into the target directory"""
+    n = g.numberOfNodes()
+    assert g.upperNodeIdBound() == n, "Node ids have to be compact!"
+    target = Path(target)
+    target.mkdir(parents=True, exist_ok=True)
+
+    indptr = _open_array(target / "indptr.npy", np.int64, n + 1)
+    for u in range(n):
+        indptr[u + 1] = g.degree(u)
+    np.cumsum(indptr, out=indptr)
+
+    indices = _open_array(target / "indices.npy", _node_dtype(n), int(indptr[n]))
+    for u in range(n):
+        indices[indptr[u]:indptr[u + 1]] = list(g.iterNeighbors(u))
+
+    indptr.flush()
+    indices.flush()
+
+
+def _read_edge_blocks(source: str, separator: str, first_node: int, chunk_bytes: int, self_loops: bool = False):
+    """Yields the edges of an edge list file as (u, v) arrays, parsing about chunk_bytes of the file at a time.
+    Self-loops are dropped unless requested, since they never influence the percolation."""
+    with open(source, 'rb') as f:
+        rest = b''
+        while True:
+            chunk = f.read(chunk_bytes)
+            data = rest + chunk
+            if not chunk:
+                rest = b''
+            else:
+                # Only parse complete lines, the remainder is prepended to the next chunk
+                end = data.rfind(b'\n') + 1
+                data, rest = data[:end], data[end:]
+            if data:
+                with warnings.catch_warnings():
+                    # Chunks consisting only of comments are no error
+                    warnings.simplefilter('ignore', UserWarning)
+                    edges = np.loadtxt(io.BytesIO(data), dtype=np.int64, comments=('%', '#'),
+                                       delimiter=separator, usecols=(0, 1), ndmin=2)
+                edges -= first_node
+                if not self_loops:
+                    edges = edges[edges[:, 0] != edges[:, 1]]
+                yield edges[:, 0], edges[:, 1]
+            if not chunk:
+                return
+
+
+def edge_list_to_csr(source: str, target: str, separator: str = ' ', first_node: int = 1,
+                     memory_budget: int = DEFAULT_MEMORY_BUDGET):
+    """Converts an undirected edge list into CSR files in the target directory without loading the graph
+    into memory. Node ids, duplicate edges and the neighbor order are handled like networkit's
+    EdgeListReader(separator, first_node), except that self-loops are dropped."""
+    target = Path(target)
+    target.mkdir(parents=True, exist_ok=True)
+    chunk_bytes = max(1, memory_budget // BYTES_PER_INPUT_BYTE)
+
+    print(f"Counting nodes of {source}...")
+    n = 0
+    for u, v in _read_edge_blocks(source, separator, first_node, chunk_bytes, self_loops=True):
+        if len(u):
+            n = max(n, int(u.max()) + 1, int(v.max()) + 1)
+
+    print(f"Counting degrees of {source}...")
+    # Degrees including duplicate edges, which bound the size of the node ranges below
+    indptr = _open_array(target / "indptr.npy", np.int64, n + 1)
+    for u, v in _read_edge_blocks(source, separator, first_node, chunk_bytes):
+        nodes, counts = np.unique(np.concatenate((u, v)), return_counts=True)
+        indptr[nodes + 1] += counts
+    np.cumsum(indptr, out=indptr)
+
+    print(f"Writing adjacency of {source}...")
+    dtype = _node_dtype(n)
+    # Split the nodes into ranges whose adjacency fits into memory, and distribute the edges into
+    # one bucket file per range, such that all files are written sequentially. The bucket files are
+    # only opened while appending a chunk, since there may be more of them than open files allowed.
+    bounds = _node_ranges(indptr, max(1, memory_budget // BYTES_PER_NEIGHBOR))
+    with tempfile.TemporaryDirectory(dir=target) as tmp:
+        for i in range(len(bounds) - 1):
+            (Path(tmp) / f"bucket{i}.bin").touch()
+        for u, v in _read_edge_blocks(source, separator, first_node, chunk_bytes):
+            # Interleave both directions, so every adjacency keeps the order of the file
+            edges = np.stack((u, v, v, u), axis=1).reshape(-1, 2).astype(dtype)
+            bucket_ids = np.searchsorted(bounds, edges[:, 0], side='right') - 1
+            order = np.argsort(bucket_ids, kind='stable')
+            edges, bucket_ids = edges[order], bucket_ids[order]
+            ids, first, counts = np.unique(bucket_ids, return_index=True, return_counts=True)
+            for i, start, count in zip(ids, first, counts):
+                with open(Path(tmp) / f"bucket{i}.bin", 'ab') as bucket:
+                    bucket.write(edges[start:start + count].tobytes())
+
+        # Like networkit's EdgeListReader, keep only the first occurrence of every edge, in either
+        # direction. Both directions of an edge end up in the buckets of their source nodes, so
+        # removing duplicate (source, target) pairs per bucket removes duplicate edges.
+        indptr[0] = 0
+        for i, (lo, hi) in enumerate(zip(bounds[:-1], bounds[1:])):
+            edges = np.fromfile(Path(tmp) / f"bucket{i}.bin", dtype=dtype).reshape(-1, 2)
+            order = np.lexsort((edges[:, 1], edges[:, 0]))
+            duplicate = np.zeros(len(order), dtype=bool)
+            duplicate[1:] = np.all(edges[order[1:]] == edges[order[:-1]], axis=1)
+            edges = edges[np.sort(order[~duplicate])]
+            edges = edges[np.argsort(edges[:, 0], kind='stable')]
+            edges[:, 1].tofile(Path(tmp) / f"adjacency{i}.bin")
+            (Path(tmp) / f"bucket{i}.bin").unlink()
+            indptr[lo + 1:hi + 1] = np.bincount(edges[:, 0] - lo, minlength=hi - lo)
+        np.cumsum(indptr, out=indptr)
+
+        indices = _open_array(target / "indices.npy", dtype, int(indptr[n]))
+        for i, (lo, hi) in enumerate(zip(bounds[:-1], bounds[1:])):
+            indices[indptr[lo]:indptr[hi]] = np.fromfile(Path(tmp) / f"adjacency{i}.bin", dtype=dtype)
+
+    indptr.flush()
+    indices.flush()
+
+
+def _node_ranges(indptr: np.ndarray, max_neighbors: int):
+    """Splits the nodes into consecutive ranges with at most max_neighbors neighbors each, and returns
+    the range boundaries. A single node with more neighbors forms its own range."""
+    n = len(indptr) - 1
+    bounds = [0]
+    while bounds[-1] < n:
+        lo = bounds[-1]
+        hi = int(np.searchsorted(indptr, indptr[lo] + max_neighbors, side='right')) - 1
+        bounds.append(min(n, max(hi, lo + 1)))
+    return np.array(bounds, dtype=np.int64)
+
+
+def _batches(frontier: np.ndarray, size: int, indptrs, max_neighbors: int):
+    """Splits the first size nodes of the frontier into consecutive batches with at most max_neighbors
+    neighbors in all graphs together, and yields them with their first index.
+    A single node with more neighbors forms its own batch."""
+    start = 0
+    while start < size:
+        window = np.asarray(frontier[start:min(size, start + max_neighbors)])
+        degrees = sum(indptr[window + 1] - indptr[window] for indptr in indptrs)
+        end = max(1, int(np.searchsorted(np.cumsum(degrees), max_neighbors, side='right')))
+        yield start, window[:end]
+        start += end
+
+
+def _neighbors(nodes: np.ndarray, indptr: np.ndarray, indices: np.ndarray):
+    """Returns the concatenated neighbors of the sorted nodes, read in increasing file order,
+    together with the index of the node they belong to and their position in the file"""
+    starts = indptr[nodes]
+    lengths = indptr[nodes + 1] - starts
+    sources = np.repeat(np.arange(len(nodes)), lengths)
+    offsets = np.cumsum(lengths) - lengths
+    positions = np.repeat(starts - offsets, lengths) + np.arange(int(lengths.sum()))
+    return np.asarray(indices[positions]), sources, positions
+
+
+def _percolate_batch(batch: np.ndarray, first_rank: int, r: int, local_csr, global_csr,
+                     marks: np.ndarray, status: np.ndarray, activations: dict):
+    """Processes consecutive frontier nodes in the order of the queue of run_perturbed_percolation,
+    while reading their adjacencies in sorted node order. Counts the changed activation types in
+    activations and returns the newly activated nodes in queue order."""
+    order = np.argsort(batch, kind='stable')
+    global_targets, global_sources, global_positions = _neighbors(batch[order], *global_csr)
+    local_targets, local_sources, local_positions = _neighbors(batch[order], *local_csr)
+    targets = np.concatenate((global_targets, local_targets))
+    ranks = (first_rank + order)[np.concatenate((global_sources, local_sources))]
+    is_local = np.concatenate((np.zeros(len(global_targets), dtype=bool), np.ones(len(local_targets), dtype=bool)))
+    positions = np.concatenate((global_positions, local_positions))
+
+    # Group the events per neighbor, in the order of the queue: by frontier node, global before local
+    # neighbors, and then by position in the adjacency
+    order = np.lexsort((positions, is_local, ranks, targets))
+    targets, ranks, is_local, positions = targets[order], ranks[order], is_local[order], positions[order]
+    states = status[targets]
+    # Only inactive nodes, and global activations of this round reached by a local neighbor, change
+    relevant = (states == INACTIVE) | ((states == NEW_GLOBAL) & is_local)
+    targets, ranks, is_local, positions = targets[relevant], ranks[relevant], is_local[relevant], positions[relevant]
+
+    neighbors, first, counts = np.unique(targets, return_index=True, return_counts=True)
+    group = np.repeat(np.arange(len(neighbors)), counts)
+    inactive = status[neighbors] == INACTIVE
+
+    upgraded = neighbors[~inactive]
+    status[upgraded] = NEW_BOTH
+    activations[ActivationType.GLOBAL] -= len(upgraded)
+    activations[ActivationType.BOTH] += len(upgraded)
+
+    # Number of global and local events up to each event of the same neighbor
+    is_global = ~is_local
+    global_counts = np.cumsum(is_global)
+    global_counts -= (global_counts[first] - is_global[first])[group]
+    local_counts = np.cumsum(is_local)
+    local_counts -= (local_counts[first] - is_local[first])[group]
+
+    # Event giving the r-th global mark, and first local event, per neighbor
+    missing = len(targets)
+    global_event = np.full(len(neighbors), missing)
+    need = (r - marks[neighbors])[group]
+    events = np.flatnonzero(is_global & (global_counts == need) & inactive[group])
+    global_event[group[events]] = events
+    local_event = np.full(len(neighbors), missing)
+    events = np.flatnonzero(is_local & (local_counts == 1) & inactive[group])
+    local_event[group[events]] = events
+
+    marks[neighbors[inactive]] += global_counts[first + counts - 1][inactive].astype(np.int32)
+
+    by_local = local_event < global_event
+    by_global = global_event < local_event
+    both = by_global & (local_event < missing)
+    status[neighbors[by_local]] = NEW_LOCAL
+    status[neighbors[by_global & ~both]] = NEW_GLOBAL
+    status[neighbors[both]] = NEW_BOTH
+    activations[ActivationType.LOCAL] += int(np.count_nonzero(by_local))
+    activations[ActivationType.GLOBAL] += int(np.count_nonzero(by_global & ~both))
+    activations[ActivationType.BOTH] += int(np.count_nonzero(both))
+
+    activated = by_local | by_global
+    events = np.where(by_local, local_event, global_event)[activated]
+    order = np.lexsort((positions[events], is_local[events], ranks[events]))
+    return neighbors[activated][order]
+
+
+def run_perturbed_percolation_out_of_core(local_path: str, global_path: str, r: int, initially_active: int,
+                                          memory_budget: int = DEFAULT_MEMORY_BUDGET, state_dir: str = None):
+    """Run perturbed percolation like run_perturbed_percolation, but on memory-mapped CSR graphs
+    (see edge_list_to_csr). The node state and the frontiers are kept in memory-mapped arrays in a
+    temporary directory inside state_dir. Each round's frontier is processed in batches whose gathered
+    neighbors fit into memory_budget bytes, reading the adjacencies of a batch in sorted node order.
+
+    The activations are evaluated in the order of run_perturbed_percolation's queue, so the results,
+    including the split into LOCAL and BOTH, are identical as long as the CSR files keep the neighbor
+    order of the networkit graphs, as graph_to_csr and edge_list_to_csr do. """
+    local_indptr, local_indices = load_csr(local_path)
+    global_indptr, global_indices = load_csr(global_path)
+    n = len(local_indptr) - 1
+    assert len(global_indptr) - 1 == n
+
+    max_neighbors = max(1, memory_budget // BYTES_PER_NEIGHBOR)
+
+    with tempfile.TemporaryDirectory(dir=state_dir) as tmp:
+        marks = _open_array(Path(tmp) / "marks.npy", np.int32, n)
+        status = _open_array(Path(tmp) / "status.npy", np.int8, n)
+        # The frontiers of the current and the next round, in the order of the queue
+        frontier = _open_array(Path(tmp) / "frontier.npy", _node_dtype(n), n)
+        next_frontier = _open_array(Path(tmp) / "next_frontier.npy", _node_dtype(n), n)
+
+        status[initially_active] = ACTIVE
+        frontier[0] = initially_active
+        size = 1
+        new_activations = [{type_name: 0 for type_name in ActivationType}]
+        new_activations[0][ActivationType.LOCAL] = 1
+
+        # Like run_perturbed_percolation, activate nothing else if no mark can be below r
+        while r > 0:
+            activations = {type_name: 0 for type_name in ActivationType}
+            next_size = 0
+            for first_rank, batch in _batches(frontier, size, (local_indptr, global_indptr), max_neighbors):
+                activated = _percolate_batch(batch, first_rank, r, (local_indptr, local_indices),
+                                             (global_indptr, global_indices), marks, status, activations)
+                next_frontier[next_size:next_size + len(activated)] = activated
+                next_size += len(activated)
+            if next_size == 0:
+                break
+
+            for start in range(0, next_size, max_neighbors):
+                status[np.sort(next_frontier[start:min(next_size, start + max_neighbors)])] = ACTIVE
+            new_activations.append(activations)
+            frontier, next_frontier = next_frontier, frontier
+            size = next_size
+
+        del marks, status, frontier, next_frontier
+
+    total_activations = list(itertools.accumulate(sum(acts.values()) for acts in new_activations))
+
+    return new_activations, total_activations
@@ -31,6 +31,8 @@ if __name__ == "__main__":
         run_bootstrap_on_real_world_experiment()
     elif experiment == 'rw_perturbed':
         run_perturbed_on_real_world_experiment()
+    elif experiment == 'rw_perturbed_pipelined':
+        run_perturbed_on_real_world_experiment(pipelined=True)
     elif experiment == 'rw_perturbed_different_r':
         run_perturbed_on_real_world_different_r_experiment()
     elif experiment == 'different_r':